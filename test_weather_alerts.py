@@ -0,0 +1,192 @@
+import json
+import sqlite3
+import threading
+
+import pytest
+
+import weather_alerts
+import weather_crawler
+
+
+def make_details(pop="30", maxt="30", wx="晴", extra_pop=True, county="台北市"):
+    pop_data = [{"time": "t1", "value": pop, "unit": "百分比"}]
+    if extra_pop:
+        pop_data.append({"time": "t2", "value": "10", "unit": "百分比"})
+    return {
+        "county": county,
+        "locations": [{
+            "name": "臺北市",
+            "elements": {
+                "降水機率": {"code": "PoP", "data": pop_data},
+                "最高溫度": {"code": "MaxT", "data": [{"time": "t1", "value": maxt, "unit": "C"}]},
+                "天氣狀況": {"code": "Wx", "data": [{"time": "t1", "value": wx, "unit": ""}]},
+            },
+        }],
+    }
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "data.db"))
+    cur = conn.cursor()
+    cur.execute(
+        "CREATE TABLE weather (id INTEGER PRIMARY KEY AUTOINCREMENT, county TEXT, normalized_name TEXT, fetched_at TEXT, data_json TEXT)"
+    )
+    weather_alerts.init_alert_tables(cur)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "crawler.db")
+    monkeypatch.setattr(weather_crawler, "DB_PATH", path)
+    weather_crawler.init_db()
+    return path
+
+
+def snapshot(conn):
+    rows = conn.execute("SELECT element, start_time, value FROM forecast_cells").fetchall()
+    return {(r[0], r[1]): r[2] for r in rows}
+
+
+def test_first_ingest_without_history_reports_all_cells_as_new(conn):
+    changes = weather_alerts.diff_forecast(conn, "臺北市", make_details())
+    assert all(old is None for _, old, _ in changes)
+    assert len(changes) == 4
+    assert snapshot(conn)[("PoP", "t1")] == "30"
+
+
+def test_first_ingest_seeds_snapshot_from_latest_weather_row(conn):
+    for pop in ("20", "80"):
+        conn.execute(
+            "INSERT INTO weather (county, normalized_name, fetched_at, data_json) VALUES (?, ?, ?, ?)",
+            ("台北市", "臺北市", "2025-01-01T00:00:00", json.dumps(make_details(pop=pop), ensure_ascii=False)),
+        )
+    changes = weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="85"))
+    assert changes == [(("臺北市", "PoP", "t1"), "80", "85")]
+    assert weather_alerts.evaluate_rules("台北市", changes) == []
+
+
+def test_unchanged_and_numerically_equal_cells_are_not_reported(conn):
+    weather_alerts.diff_forecast(conn, "臺北市", make_details(maxt="35"))
+    assert weather_alerts.diff_forecast(conn, "臺北市", make_details(maxt="35.0")) == []
+
+
+def test_placeholder_value_keeps_previous_snapshot(conn):
+    weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="80"))
+    assert weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="N/A")) == []
+    assert snapshot(conn)[("PoP", "t1")] == "80"
+    assert weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="90")) == [
+        (("臺北市", "PoP", "t1"), "80", "90")
+    ]
+
+
+def test_text_elements_compare_as_strings(conn):
+    weather_alerts.diff_forecast(conn, "臺北市", make_details(wx="晴"))
+    changes = weather_alerts.diff_forecast(conn, "臺北市", make_details(wx="短暫雨"))
+    assert changes == [(("臺北市", "Wx", "t1"), "晴", "短暫雨")]
+
+
+def test_expired_cells_are_deleted(conn):
+    weather_alerts.diff_forecast(conn, "臺北市", make_details())
+    weather_alerts.diff_forecast(conn, "臺北市", make_details(extra_pop=False))
+    assert ("PoP", "t2") not in snapshot(conn)
+
+
+def test_rules_fire_only_when_crossing_threshold(conn):
+    weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="30", maxt="30"))
+
+    changes = weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="80", maxt="36"))
+    events = weather_alerts.evaluate_rules("台北市", changes)
+    assert {(e["element"], e["old"], e["new"]) for e in events} == {("PoP", "30", "80"), ("MaxT", "30", "36")}
+
+    changes = weather_alerts.diff_forecast(conn, "臺北市", make_details(pop="90", maxt="36"))
+    assert weather_alerts.evaluate_rules("台北市", changes) == []
+
+
+@pytest.mark.parametrize("rule", [
+    {"name": "bad op", "element": "PoP", "op": "=>", "threshold": 70},
+    {"name": "no element", "op": ">", "threshold": 70},
+    {"name": "text threshold", "element": "PoP", "op": ">", "threshold": "70"},
+    {"name": "text element", "element": "Wx", "op": ">", "threshold": 1},
+])
+def test_invalid_rules_raise_value_error(rule):
+    with pytest.raises(ValueError, match=rule["name"]):
+        weather_alerts.evaluate_rules("台北市", [], [rule])
+
+
+class FailingSink:
+    def emit(self, events):
+        raise OSError("sink down")
+
+
+def test_dispatch_alerts_fans_out_and_collects_errors(tmp_path):
+    events = [{"county": "台北市", "rule": "r"}]
+    file_sink = weather_alerts.FileSink(str(tmp_path / "alerts.jsonl"))
+    failing = FailingSink()
+    errors = weather_alerts.dispatch_alerts(events, [failing, file_sink])
+    assert [sink for sink, _ in errors] == [failing]
+    lines = (tmp_path / "alerts.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == events
+    assert weather_alerts.dispatch_alerts([], [failing]) == []
+
+
+def test_save_records_alerts_in_same_transaction(db_path):
+    weather_crawler.save_weather_to_db(make_details(pop="30"))
+    with pytest.raises(weather_alerts.AlertDispatchError) as excinfo:
+        weather_crawler.save_weather_to_db(make_details(pop="80"), sinks=[FailingSink()])
+    assert [e["new"] for e in excinfo.value.events] == ["80"]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather").fetchone()[0] == 2
+        alerts = conn.execute("SELECT element, old_value, new_value FROM weather_alerts").fetchall()
+        assert alerts == [("PoP", "30", "80")]
+    finally:
+        conn.close()
+
+
+def test_save_without_county_skips_detection(db_path):
+    details = make_details()
+    del details["county"]
+    assert weather_crawler.save_weather_to_db(details) == []
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM weather").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM forecast_cells").fetchone()[0] == 0
+    finally:
+        conn.close()
+
+
+def test_concurrent_ingests_record_crossing_once(db_path):
+    weather_crawler.save_weather_to_db(make_details(pop="30"))
+
+    conn_a = sqlite3.connect(db_path, timeout=5)
+    results = {}
+
+    def ingest_b():
+        conn_b = sqlite3.connect(db_path, timeout=5)
+        try:
+            results["b"] = weather_alerts.process_forecast(conn_b, "台北市", "臺北市", make_details(pop="80"))
+            conn_b.commit()
+        finally:
+            conn_b.close()
+
+    try:
+        events_a = weather_alerts.process_forecast(conn_a, "台北市", "臺北市", make_details(pop="80"))
+        thread = threading.Thread(target=ingest_b)
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()  # B 需等待 A 釋放寫入鎖
+        conn_a.commit()
+        thread.join()
+
+        assert len(events_a) == 1
+        assert results["b"] == []
+        alerts = conn_a.execute("SELECT element, old_value, new_value FROM weather_alerts").fetchall()
+        assert alerts == [("PoP", "30", "80")]
+    finally:
+        conn_a.close()
@@ -0,0 +1,308 @@
+import json
+import numbers
+import operator
+import sqlite3
+from datetime import datetime
+
+import requests
+
+
+# 預設警示規則：以氣象元素代碼 (code) 對應，門檻以數值比較
+DEFAULT_RULES = [
+    {"name": "降水機率超過 70%", "element": "PoP", "op": ">", "threshold": 70},
+    {"name": "最高溫度超過 35°C", "element": "MaxT", "op": ">", "threshold": 35},
+]
+
+OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+# 以數值比較的氣象元素；其餘元素（如 Wx、CI）以字串比較
+NUMERIC_ELEMENTS = {"PoP", "MaxT", "MinT", "RH"}
+
+
+class AlertDispatchError(RuntimeError):
+    """一個或多個 sink 傳送警示失敗（資料與警示已寫入資料庫）
+
+    events 保留本次觸發的警示事件，供呼叫端顯示。
+    """
+
+    def __init__(self, errors, events):
+        self.errors = errors
+        self.events = events
+        details = "; ".join(f"{type(sink).__name__}: {e}" for sink, e in errors)
+        super().__init__(f"警示傳送失敗: {details}")
+
+
+def init_alert_tables(cur):
+    """建立警示所需的表格（若不存在則建立）
+
+    - forecast_cells: 每個縣市最新一次預報的逐格快照，供增量比對
+    - weather_alerts: 觸發的警示事件
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS forecast_cells (
+            normalized_name TEXT,
+            location TEXT,
+            element TEXT,
+            start_time TEXT,
+            value TEXT,
+            PRIMARY KEY (normalized_name, location, element, start_time)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS weather_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            county TEXT,
+            location TEXT,
+            element TEXT,
+            start_time TEXT,
+            rule TEXT,
+            old_value TEXT,
+            new_value TEXT,
+            detected_at TEXT
+        )
+        """
+    )
+
+
+def parse_numeric_value(value_str):
+    """嘗試將字符串轉換為數字"""
+    try:
+        return float(value_str)
+    except (ValueError, TypeError):
+        return None
+
+
+def typed_value(code, value):
+    """依元素代碼轉換為可比較的值；數值元素無法解析（如 "N/A"）時回傳 None"""
+    if code in NUMERIC_ELEMENTS:
+        return parse_numeric_value(value)
+    return value
+
+
+def iter_forecast_cells(details):
+    """將預報結構展開為 ((地區, 元素代碼, 時間), 值) 的序列"""
+    for location in details.get("locations", []):
+        location_name = location.get("name")
+        for element_info in location.get("elements", {}).values():
+            code = element_info.get("code")
+            for time_data in element_info.get("data", []):
+                yield (location_name, code, time_data.get("time")), time_data.get("value")
+
+
+def validate_rules(rules):
+    """檢查規則格式，格式錯誤時拋出 ValueError"""
+    for rule in rules:
+        if not isinstance(rule.get("element"), str) or not rule["element"]:
+            raise ValueError(f"警示規則缺少 element: {rule!r}")
+        if rule["element"] not in NUMERIC_ELEMENTS:
+            raise ValueError(f"警示規則的 element 必須為數值元素（{', '.join(sorted(NUMERIC_ELEMENTS))}）: {rule!r}")
+        if rule.get("op") not in OPERATORS:
+            raise ValueError(f"警示規則的 op 不支援（可用 {', '.join(OPERATORS)}）: {rule!r}")
+        threshold = rule.get("threshold")
+        if not isinstance(threshold, numbers.Real) or isinstance(threshold, bool):
+            raise ValueError(f"警示規則的 threshold 必須為數字: {rule!r}")
+
+
+def _matches(rule, value):
+    """判斷數值是否符合規則；非數值一律視為不符合"""
+    number = parse_numeric_value(value)
+    if number is None:
+        return False
+    return OPERATORS[rule["op"]](number, rule["threshold"])
+
+
+def _seed_snapshot(cur, normalized_name):
+    """快照為空時，以該縣市最近一筆 weather 紀錄建立快照（僅升級後第一次會執行）"""
+    cur.execute(
+        "SELECT data_json FROM weather WHERE normalized_name=? ORDER BY id DESC LIMIT 1",
+        (normalized_name,),
+    )
+    row = cur.fetchone()
+    if not row:
+        return {}
+    try:
+        previous = {
+            key: value
+            for key, value in iter_forecast_cells(json.loads(row[0]))
+            if typed_value(key[1], value) is not None
+        }
+    except (ValueError, TypeError, AttributeError):
+        return {}
+    cur.executemany(
+        "INSERT OR REPLACE INTO forecast_cells (normalized_name, location, element, start_time, value) VALUES (?, ?, ?, ?, ?)",
+        [(normalized_name, *key, value) for key, value in previous.items()],
+    )
+    return previous
+
+
+def diff_forecast(conn, normalized_name, details):
+    """比對新預報與資料庫中的上一份快照，並更新快照
+
+    只讀取該縣市的最新快照（不掃描歷史紀錄），僅寫入有變動或已過期的格子。
+    快照為空時會先以最近一筆 weather 紀錄補建，因此須在寫入本次紀錄之前呼叫。
+
+    Returns:
+        list: [((地區, 元素代碼, 時間), 舊值, 新值), ...]，舊值為 None 代表新出現的格子
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT location, element, start_time, value FROM forecast_cells WHERE normalized_name=?",
+        (normalized_name,),
+    )
+    previous = {(r[0], r[1], r[2]): r[3] for r in cur.fetchall()}
+    if not previous:
+        previous = _seed_snapshot(cur, normalized_name)
+
+    changed = []
+    seen = set()
+    for key, value in iter_forecast_cells(details):
+        seen.add(key)
+        # 無效值（例如數值元素為 "N/A"）不視為變動，保留原快照
+        if typed_value(key[1], value) is None:
+            continue
+        old = previous.get(key)
+        if old is None or typed_value(key[1], old) != typed_value(key[1], value):
+            changed.append((key, old, value))
+
+    expired = [key for key in previous if key not in seen]
+
+    if changed:
+        cur.executemany(
+            "INSERT OR REPLACE INTO forecast_cells (normalized_name, location, element, start_time, value) VALUES (?, ?, ?, ?, ?)",
+            [(normalized_name, *key, new) for key, _, new in changed],
+        )
+    if expired:
+        cur.executemany(
+            "DELETE FROM forecast_cells WHERE normalized_name=? AND location=? AND element=? AND start_time=?",
+            [(normalized_name, *key) for key in expired],
+        )
+    return changed
+
+
+def evaluate_rules(county_name, changes, rules=None):
+    """只針對有變動的格子套用規則，回傳觸發的警示事件
+
+    規則以「跨越門檻」判定：新值符合而舊值不符合（或不存在）時才觸發，
+    因此同一格維持在門檻之上不會重複通知。
+    """
+    if rules is None:
+        rules = DEFAULT_RULES
+    validate_rules(rules)
+
+    rules_by_element = {}
+    for rule in rules:
+        rules_by_element.setdefault(rule["element"], []).append(rule)
+
+    events = []
+    detected_at = datetime.now().isoformat()
+    for (location_name, code, start_time), old, new in changes:
+        for rule in rules_by_element.get(code, []):
+            if _matches(rule, new) and not _matches(rule, old):
+                events.append({
+                    "county": county_name,
+                    "location": location_name,
+                    "element": code,
+                    "time": start_time,
+                    "rule": rule.get("name") or f"{rule['element']} {rule['op']} {rule['threshold']}",
+                    "old": old,
+                    "new": new,
+                    "detected_at": detected_at,
+                })
+    return events
+
+
+def record_alerts(cur, events):
+    """將警示事件寫入 weather_alerts 表格（不 commit）"""
+    cur.executemany(
+        "INSERT INTO weather_alerts (county, location, element, start_time, rule, old_value, new_value, detected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (e["county"], e["location"], e["element"], e["time"], e["rule"], e["old"], e["new"], e["detected_at"])
+            for e in events
+        ],
+    )
+
+
+def process_forecast(conn, county_name, normalized_name, details, rules=None):
+    """於寫入資料時增量比對預報，並在同一交易中記錄警示（呼叫端負責 commit）
+
+    須在寫入本次 weather 紀錄之前呼叫；normalized_name 為 None 時不做比對。
+    比對前會以 BEGIN IMMEDIATE 取得寫入鎖，讓快照讀取、更新與警示寫入在同一個
+    鎖定的交易中完成，避免同時寫入同一縣市時重複觸發警示。
+    """
+    if rules is not None:
+        validate_rules(rules)
+    if normalized_name is None:
+        return []
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    changes = diff_forecast(conn, normalized_name, details)
+    events = evaluate_rules(county_name, changes, rules)
+    if events:
+        record_alerts(conn.cursor(), events)
+    return events
+
+
+class FileSink:
+    """將警示事件以 JSON Lines 附加寫入檔案"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, events):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """將警示事件以 JSON POST 至指定 URL（例如本機測試服務）"""
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def emit(self, events):
+        response = requests.post(self.url, json=events, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class DbSink:
+    """將警示事件寫入另一個 SQLite 資料庫的 weather_alerts 表格"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def emit(self, events):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cur = conn.cursor()
+            init_alert_tables(cur)
+            record_alerts(cur, events)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def dispatch_alerts(events, sinks):
+    """將警示事件送往各 sink；單一 sink 失敗不影響其他 sink
+
+    Returns:
+        list: 發生錯誤的 (sink, 例外) 清單
+    """
+    errors = []
+    if not events:
+        return errors
+    for sink in sinks:
+        try:
+            sink.emit(events)
+        except Exception as e:
+            errors.append((sink, e))
+    return errors
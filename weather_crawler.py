@@ -5,6 +5,8 @@ import urllib3
 import sqlite3
 import os
 
+import weather_alerts
+
 # 禁用 SSL 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -33,19 +35,28 @@ def init_db():
             )
             """
         )
+        weather_alerts.init_alert_tables(cur)
         conn.commit()
     finally:
         conn.close()
 
 
-def save_weather_to_db(weather_details):
-    """將查詢結果存入資料庫（會新增一筆紀錄）
+def save_weather_to_db(weather_details, rules=None, sinks=None):
+    """將查詢結果存入資料庫（會新增一筆紀錄），並增量比對預報觸發警示
 
     Args:
         weather_details (dict): 與 `get_weather_details` 相同的結構
+        rules (list): 警示規則，預設為 `weather_alerts.DEFAULT_RULES`
+        sinks (list): 額外的警示輸出目標；警示一律在同一交易中寫入 weather_alerts 表格
+
+    Returns:
+        list: 本次觸發的警示事件
+
+    Raises:
+        weather_alerts.AlertDispatchError: 額外 sink 傳送失敗（資料與警示仍已存入資料庫）
     """
     if not weather_details:
-        return
+        return []
 
     county_name = weather_details.get("county")
     normalized = county_name.replace("台", "臺") if county_name else None
@@ -53,6 +64,8 @@ def save_weather_to_db(weather_details):
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
+        # 需在寫入本次紀錄前比對，快照為空時才能以上一筆紀錄補建
+        events = weather_alerts.process_forecast(conn, county_name, normalized, weather_details, rules)
         cur.execute(
             "INSERT INTO weather (county, normalized_name, fetched_at, data_json) VALUES (?, ?, ?, ?)",
             (
@@ -66,6 +79,11 @@ def save_weather_to_db(weather_details):
     finally:
         conn.close()
 
+    errors = weather_alerts.dispatch_alerts(events, sinks or [])
+    if errors:
+        raise weather_alerts.AlertDispatchError(errors, events)
+    return events
+
 
 def get_weather_details(county_name):
     """
@@ -214,11 +232,17 @@ def main():
         if weather:
             display_weather_details(weather)
             # 儲存本次查詢結果到本機資料庫（每次查詢皆新增一筆）
+            events = []
             try:
-                save_weather_to_db(weather)
+                events = save_weather_to_db(weather)
                 print("已將本次查詢結果儲存至 data.db")
+            except weather_alerts.AlertDispatchError as e:
+                events = e.events
+                print(f"已將本次查詢結果儲存至 data.db，但{e}")
             except Exception as e:
                 print(f"儲存資料時發生錯誤: {e}")
+            for event in events:
+                print(f"⚠ {event['location']} {event['time']} {event['rule']}: {event['old']} -> {event['new']}")
         else:
             print(f"找不到 {county} 的天氣資訊")
         
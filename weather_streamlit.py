@@ -9,6 +9,8 @@ import os
 import plotly.express as px
 import plotly.graph_objects as go
 
+import weather_alerts
+
 # 禁用 SSL 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -36,19 +38,25 @@ def init_db():
             )
             """
         )
+        weather_alerts.init_alert_tables(cur)
         conn.commit()
     finally:
         conn.close()
 
 
-def save_weather_to_db(county_name, details):
-    """將抓到的天氣資料存入 SQLite"""
+def save_weather_to_db(county_name, details, rules=None, sinks=None):
+    """將抓到的天氣資料存入 SQLite，並回傳增量比對後觸發的警示事件
+
+    警示一律在同一交易中寫入 weather_alerts 表格；sinks 為額外輸出目標，
+    傳送失敗時拋出 weather_alerts.AlertDispatchError。
+    """
     if not details:
-        return
+        return []
     normalized = county_name.replace("台", "臺")
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
+        events = weather_alerts.process_forecast(conn, county_name, normalized, details, rules)
         cur.execute(
             "INSERT INTO weather (county, normalized_name, fetched_at, data_json) VALUES (?, ?, ?, ?)",
             (county_name, normalized, datetime.now().isoformat(), json.dumps(details, ensure_ascii=False))
@@ -57,6 +65,11 @@ def save_weather_to_db(county_name, details):
     finally:
         conn.close()
 
+    errors = weather_alerts.dispatch_alerts(events, sinks or [])
+    if errors:
+        raise weather_alerts.AlertDispatchError(errors, events)
+    return events
+
 
 def get_recent_weather(county_name=None, limit=20):
     """取得最近儲存的天氣紀錄（可選縣市過濾）"""
@@ -149,14 +162,6 @@ def get_weather_details(county_name):
         return None
 
 
-def parse_numeric_value(value_str):
-    """嘗試將字符串轉換為數字"""
-    try:
-        return float(value_str)
-    except (ValueError, TypeError):
-        return None
-
-
 def create_temperature_chart(weather_data):
     """創建溫度圖表"""
     if not weather_data or not weather_data.get("locations"):
@@ -175,8 +180,8 @@ def create_temperature_chart(weather_data):
     
     for i in range(min(len(max_temps), len(min_temps), 10)):
         date = max_temps[i]["time"].split(" ")[0]
-        max_val = parse_numeric_value(max_temps[i]["value"])
-        min_val = parse_numeric_value(min_temps[i]["value"])
+        max_val = weather_alerts.parse_numeric_value(max_temps[i]["value"])
+        min_val = weather_alerts.parse_numeric_value(min_temps[i]["value"])
         
         if max_val is not None and min_val is not None:
             dates.append(date)
@@ -227,7 +232,7 @@ def create_pop_chart(weather_data):
     
     for i in range(min(len(pop_data), 10)):
         date = pop_data[i]["time"].split(" ")[0]
-        val = parse_numeric_value(pop_data[i]["value"])
+        val = weather_alerts.parse_numeric_value(pop_data[i]["value"])
         
         if val is not None:
             dates.append(date)
@@ -332,6 +337,21 @@ def main():
         
         if weather_data:
             st.success(f"✅ 成功取得 {selected_county} 的天氣資訊！")
+
+            # 儲存本次查詢到資料庫，並於分頁上方顯示觸發的警示
+            events = []
+            save_error = None
+            dispatch_error = None
+            try:
+                events = save_weather_to_db(selected_county, weather_data)
+            except weather_alerts.AlertDispatchError as e:
+                events = e.events
+                dispatch_error = e
+            except Exception as e:
+                save_error = e
+
+            for event in events:
+                st.warning(f"⚠️ {event['location']} {event['time']} {event['rule']}: {event['old']} → {event['new']}")
             
             # 建立標籤頁（增加儲存紀錄分頁）
             tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 預報概覽", "🌡️ 溫度趨勢", "☔ 降水機率", "📋 詳細表格", "💾 儲存紀錄"])
@@ -400,12 +420,13 @@ def main():
             
             with tab5:
                 st.subheader("儲存紀錄（資料庫）")
-                # 儲存本次查詢到資料庫
-                try:
-                    save_weather_to_db(selected_county, weather_data)
+                if save_error is not None:
+                    st.error(f"儲存資料時發生錯誤: {save_error}")
+                elif dispatch_error is not None:
+                    st.success("已將本次資料存入本機資料庫")
+                    st.error(f"警示已記錄於資料庫，但{dispatch_error}")
+                else:
                     st.success("已將本次資料存入本機資料庫")
-                except Exception as e:
-                    st.error(f"儲存資料時發生錯誤: {e}")
 
                 # 顯示最近的紀錄供檢視
                 records = get_recent_weather(selected_county, limit=50)